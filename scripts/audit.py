@@ -10,38 +10,75 @@ Requires SUPABASE_SERVICE_KEY (admin-only operation).
 """
 
 import argparse
+import bisect
+import hashlib
 import json
+import os
 import re
 import sys
-import urllib.parse
 from pathlib import Path
 
 # Add scripts/ to path so lib/ is importable
 sys.path.insert(0, str(Path(__file__).resolve().parent))
-from lib.supabase import supabase_get, supabase_rpc
+from lib.supabase import q, supabase_get, supabase_iter, supabase_rpc_batch
 
 
 def parse_args():
     p = argparse.ArgumentParser(description="Audit skills for security issues")
     p.add_argument("--name", default=None, help="Audit a specific skill by name (default: all)")
     p.add_argument("--dry-run", action="store_true", help="Show results without updating database")
-    p.add_argument("--verbose", "-v", action="store_true", help="Show detailed findings per skill")
+    p.add_argument("--verbose", "-v", action="store_true", help="Show detailed findings per skill (full scan, no early exit on FAIL)")
     return p.parse_args()
 
 
+# --- Regex engine ---
+
+# AUDIT_USE_RE2=1 switches rule matching to google-re2: linear-time matching,
+# so adversarial skill content can't trigger catastrophic backtracking.
+_re = re
+if os.environ.get("AUDIT_USE_RE2") == "1":
+    try:
+        import re2 as _re
+    except ImportError:
+        print("WARNING: AUDIT_USE_RE2=1 but google-re2 is not installed; using re", file=sys.stderr)
+
+
+def _compile(pattern, portable=None):
+    """Compile a rule with the active engine.
+
+    RE2 has no lookbehind; rules that use one pass an equivalent `portable`
+    pattern that is used instead when running on RE2.
+    """
+    if portable and _re is not re:
+        pattern = portable
+    return _re.compile(pattern)
+
+
 # --- Security rules ---
 
 DANGEROUS_PATTERNS = [
     # Code injection
-    (r'\beval\s*\(', "eval() call — arbitrary code execution"),
-    (r'\bexec\s*\(', "exec() call — arbitrary code execution"),
-    (r'(?<!re\.)\bcompile\s*\(', "compile() call — potential code execution"),
+    (_compile(r'\beval\s*\('), "eval() call — arbitrary code execution"),
+    (_compile(r'\bexec\s*\('), "exec() call — arbitrary code execution"),
+    (_compile(r'(?<!re\.)\bcompile\s*\(',
+              portable=r'(?:^|[^.]|(?:^|[^e])\.|(?:^|[^r])e\.)\bcompile\s*\('),
+     "compile() call — potential code execution"),
     # Command injection
-    (r'os\.system\s*\(', "os.system() — shell command injection risk"),
-    (r'subprocess\.\w+\(.*shell\s*=\s*True', "subprocess with shell=True — command injection risk"),
-    (r'os\.popen\s*\(', "os.popen() — shell command injection risk"),
+    (_compile(r'os\.system\s*\('), "os.system() — shell command injection risk"),
+    (_compile(r'subprocess\.\w+\(.*shell\s*=\s*True'), "subprocess with shell=True — command injection risk"),
+    (_compile(r'os\.popen\s*\('), "os.popen() — shell command injection risk"),
     # Path traversal
-    (r'\.\./\.\.',  "path traversal pattern (../../)"),
+    (_compile(r'\.\./\.\.'),  "path traversal pattern (../../)"),
+]
+
+# Check f-string/dynamic URLs — WARN unless clearly suspicious
+# Most skills legitimately use f-string URLs for API calls; only flag as
+# info so reviewers are aware, not as automatic failures.
+URL_PATTERNS = [
+    (_compile(r'urllib\.request\.urlopen\s*\(\s*[^)]*\+'), "dynamic URL construction"),
+    (_compile(r'requests\.(get|post)\s*\(\s*f["\']'), "f-string URL in requests"),
+    (_compile(r'urlopen\s*\(\s*f["\']'), "f-string URL in urlopen"),
+    (_compile(r'Request\s*\(\s*f["\']'), "f-string URL in Request"),
 ]
 
 # URL patterns that look suspicious but are OK for known API domains
@@ -55,139 +92,284 @@ KNOWN_API_DOMAINS = [
 ]
 
 SECRET_PATTERNS = [
-    (r'(?:sk|api|token|key|secret|password)[-_]?\w*\s*=\s*["\'][A-Za-z0-9_\-]{20,}', "hardcoded secret/API key"),
-    (r'Bearer\s+[A-Za-z0-9_\-]{20,}', "hardcoded Bearer token"),
+    (_compile(r'(?i)(?:sk|api|token|key|secret|password)[-_]?\w*\s*=\s*["\'][A-Za-z0-9_\-]{20,}'),
+     "hardcoded secret/API key"),
+    (_compile(r'(?i)Bearer\s+[A-Za-z0-9_\-]{20,}'), "hardcoded Bearer token"),
 ]
 
+# Every SECRET_PATTERNS match contains one of these (after casefold())
+_SECRET_TOKENS = ("sk", "api", "token", "key", "secret", "password", "bearer")
+
 HARDCODED_PATH_PATTERNS = [
-    (r'/home/\w+/', "hardcoded home path"),
-    (r'C:\\\\Users\\\\', "hardcoded Windows path"),
+    (_compile(r'/home/\w+/'), "hardcoded home path"),
+    (_compile(r'C:\\\\Users\\\\'), "hardcoded Windows path"),
 ]
 
 
-def audit_skill(skill):
-    """Run security checks on a single skill. Returns (passed: bool, findings: list[str])."""
-    findings = []
-    file_tree = skill.get("file_tree", {})
-    name = skill.get("name", "unknown")
-
-    # 1. Check file_tree for dangerous patterns
-    for rel_path, content in file_tree.items():
-        if not isinstance(content, str):
-            continue
-
-        # Skip binary placeholders
-        if content.startswith("[binary file,"):
-            continue
-
-        for pattern, desc in DANGEROUS_PATTERNS:
-            matches = re.findall(pattern, content)
-            if matches:
-                findings.append(f"FAIL [{rel_path}]: {desc}")
-
-        # Check f-string/dynamic URLs — WARN unless clearly suspicious
-        # Most skills legitimately use f-string URLs for API calls; only flag as
-        # info so reviewers are aware, not as automatic failures.
-        url_patterns = [
-            (r'urllib\.request\.urlopen\s*\(\s*[^)]*\+', "dynamic URL construction"),
-            (r'requests\.(get|post)\s*\(\s*f["\']', "f-string URL in requests"),
-            (r'urlopen\s*\(\s*f["\']', "f-string URL in urlopen"),
-            (r'Request\s*\(\s*f["\']', "f-string URL in Request"),
-        ]
-        for pattern, desc in url_patterns:
-            matches = re.finditer(pattern, content)
+def _known_domain_spans(content):
+    """Return sorted (start, end) spans of every KNOWN_API_DOMAINS occurrence in content."""
+    spans = []
+    for domain in KNOWN_API_DOMAINS:
+        i = content.find(domain)
+        while i != -1:
+            spans.append((i, i + len(domain)))
+            i = content.find(domain, i + 1)
+    spans.sort()
+    return spans
+
+
+def _has_domain_in(spans, start, end):
+    """True if a known domain lies entirely within content[start:end]."""
+    i = bisect.bisect_left(spans, (start,))
+    while i < len(spans) and spans[i][0] < end:
+        if spans[i][1] <= end:
+            return True
+        i += 1
+    return False
+
+
+_STR_RULES = (DANGEROUS_PATTERNS, URL_PATTERNS, SECRET_PATTERNS, HARDCODED_PATH_PATTERNS)
+# Same rules compiled as bytes patterns, for ASCII-only files
+_BYTES_RULES = tuple(
+    [(_re.compile(pattern.pattern.encode("ascii")), desc) for pattern, desc in rules]
+    for rules in _STR_RULES
+)
+
+# Max characters of any one file fed to the rules (same as the whole-skill size cap)
+SCAN_LIMIT = 500_000
+
+
+# --- Scan cache ---
+
+# Per-file scan results keyed by content SHA-256, reused across runs.
+# Invalidated whenever the rules (or regex engine) change. Kept outside the
+# skill directory so publishing this skill never uploads it, and in its own
+# subdirectory so the HTTP response cache's pruning leaves it alone.
+SCAN_CACHE_FILE = Path.home() / ".cache" / "skill-evolution" / "audit" / "scan_cache.json"
+_RULES_VERSION = hashlib.sha256(repr((
+    _re.__name__,
+    [(p.pattern, d) for rules in _STR_RULES for p, d in rules],
+    KNOWN_API_DOMAINS,
+)).encode()).hexdigest()
+
+
+def load_scan_cache():
+    """Load cached scan_file() results, or {} if missing, unreadable or stale."""
+    try:
+        data = json.loads(SCAN_CACHE_FILE.read_text())
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(data, dict) or data.get("rules") != _RULES_VERSION:
+        return {}
+    return data.get("files", {})
+
+
+def save_scan_cache(cache):
+    """Persist scan_file() results for the next run (best-effort)."""
+    try:
+        SCAN_CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+        SCAN_CACHE_FILE.write_text(json.dumps({"rules": _RULES_VERSION, "files": cache}))
+    except OSError as e:
+        print(f"WARNING: could not save audit cache to {SCAN_CACHE_FILE}: {e}", file=sys.stderr)
+
+
+def _has_fail(hits):
+    return any(level == "FAIL" for level, _ in hits)
+
+
+def scan_file(content, stop_at_fail=False):
+    """Run the pattern rules on one file. Returns [[level, message], ...].
+
+    With stop_at_fail, rule groups after the first FAIL are skipped, so the
+    result may be incomplete.
+    """
+    # ASCII-only files (the common case) are matched as bytes — identical
+    # results on ASCII input, without the engine's Unicode-aware matching
+    if content.isascii():
+        data = content.encode("ascii")
+        dangerous, urls, secrets, paths = _BYTES_RULES
+    else:
+        data = content
+        dangerous, urls, secrets, paths = _STR_RULES
+
+    hits = []
+    for pattern, desc in dangerous:
+        if pattern.search(data):
+            hits.append(["FAIL", desc])
+    if stop_at_fail and hits:
+        return hits
+
+    # Literal prefilters: every URL rule needs one of these substrings, and every
+    # secret rule one of _SECRET_TOKENS — skip the regex pass when none is present
+    if "urlopen" in content or "requests." in content or "Request" in content:
+        domain_spans = None  # built on the first URL match
+        for pattern, desc in urls:
+            matches = pattern.finditer(data)
             for m in matches:
                 # Check surrounding context for known API domains → skip entirely
+                if domain_spans is None:
+                    domain_spans = _known_domain_spans(content)
                 start = max(0, m.start() - 50)
                 end = min(len(content), m.end() + 200)
-                context = content[start:end]
-                if any(domain in context for domain in KNOWN_API_DOMAINS):
+                if _has_domain_in(domain_spans, start, end):
                     continue
-                findings.append(f"WARN [{rel_path}]: {desc}")
+                hits.append(["WARN", desc])
 
-        for pattern, desc in SECRET_PATTERNS:
-            matches = re.findall(pattern, content, re.IGNORECASE)
+    folded = content.casefold()
+    if any(tok in folded for tok in _SECRET_TOKENS):
+        for pattern, desc in secrets:
+            matches = pattern.findall(data)
             for m in matches:
+                if not isinstance(m, str):
+                    m = m.decode("ascii")
                 # Skip false positives
                 if any(fp in m for fp in ["SUPABASE", "TASKPOOL", "$HOME", "${HOME}", "os.environ", "os.getenv"]):
                     continue
-                findings.append(f"FAIL [{rel_path}]: {desc} — {m[:50]}...")
+                hits.append(["FAIL", f"{desc} — {m[:50]}..."])
+    if stop_at_fail and _has_fail(hits):
+        return hits
 
-        for pattern, desc in HARDCODED_PATH_PATTERNS:
-            if re.search(pattern, content):
-                findings.append(f"WARN [{rel_path}]: {desc}")
+    for pattern, desc in paths:
+        if pattern.search(data):
+            hits.append(["WARN", desc])
 
-    # 2. Check SKILL.md size
-    skill_md = skill.get("skill_md", "")
-    if len(skill_md.splitlines()) > 500:
-        findings.append(f"WARN: SKILL.md is {len(skill_md.splitlines())} lines (recommended ≤300)")
+    return hits
+
+
+def audit_skill(skill, verbose=False, cache=None, used=None):
+    """Run security checks on a single skill. Returns (passed: bool, findings: list[str]).
+
+    Size/count/description limits are checked first; a skill that fails them is
+    not pattern-scanned unless verbose=True. `cache` (see load_scan_cache) maps
+    file content hashes to scan_file() results and is filled in on misses;
+    every cached result this skill relied on is also copied into `used`.
+    """
+    findings = []
+    file_tree = skill.get("file_tree", {})
+    name = skill.get("name", "unknown")
 
-    # 3. Check file_tree total size
+    # 1. Check file_tree total size
     total_size = sum(len(v) for v in file_tree.values() if isinstance(v, str))
     if total_size > 500_000:
         findings.append(f"FAIL: file_tree too large ({total_size} bytes, max 500KB)")
 
-    # 4. Check file count
+    # 2. Check file count
     if len(file_tree) > 50:
         findings.append(f"FAIL: too many files ({len(file_tree)}, max 50)")
 
-    # 5. Check description length
+    # 3. Check description length
     desc = skill.get("description", "")
     if len(desc) > 1000:
         findings.append(f"FAIL: description too long ({len(desc)} chars)")
 
+    # Hard limits already reject the skill — skip the regex scan unless the
+    # caller wants the full report
+    if findings and not verbose:
+        return False, findings
+
+    # 4. Check file_tree for dangerous patterns
+    # Without verbose, scanning stops once the skill has a FAIL — the verdict can't change
+    stop_at_fail = not verbose
+    has_fail = False
+    for rel_path, content in file_tree.items():
+        if stop_at_fail and has_fail:
+            break
+        if not isinstance(content, str):
+            continue
+
+        # Skip binary placeholders. Every text file is scanned whatever its name:
+        # a skip-list by extension would let a payload dodge the audit by renaming.
+        if content.startswith("[binary file,"):
+            continue
+
+        content = content[:SCAN_LIMIT]
+        if cache is None:
+            hits = scan_file(content, stop_at_fail)
+        else:
+            # Identical content (shared boilerplate, unchanged re-runs) is scanned once
+            digest = hashlib.sha256(content.encode("utf-8", "surrogatepass")).hexdigest()
+            hits = cache.get(digest)
+            if hits is None:
+                hits = scan_file(content, stop_at_fail)
+                # Only complete results are reusable
+                if not (stop_at_fail and _has_fail(hits)):
+                    cache[digest] = hits
+            if used is not None and digest in cache:
+                used[digest] = hits
+        findings.extend(f"{level} [{rel_path}]: {msg}" for level, msg in hits)
+        has_fail = has_fail or _has_fail(hits)
+
+    # 5. Check SKILL.md size
+    skill_md = skill.get("skill_md", "")
+    line_count = skill_md.count("\n") + (bool(skill_md) and not skill_md.endswith("\n"))
+    if line_count > 500:
+        findings.append(f"WARN: SKILL.md is {line_count} lines (recommended ≤300)")
+
     # Determine pass/fail: FAIL findings = reject, WARN-only = pass with warnings
     has_fail = any(f.startswith("FAIL") for f in findings)
     return not has_fail, findings
 
 
+def build_result(skill, passed, findings, verbose=False):
+    """Summarise one skill's audit for the JSON report."""
+    result = {
+        "name": skill["name"],
+        "variant": skill["variant"],
+        "passed": passed,
+        "finding_count": len(findings),
+        "previously_audited": skill.get("audited_at") is not None,
+    }
+
+    if verbose or not passed:
+        result["findings"] = findings
+
+    return result
+
+
 def main():
     args = parse_args()
 
     # Fetch skills (service key to read file_tree which may not be exposed via anon)
     select = "id,name,variant,description,author,skill_md,file_tree,audited_at"
     if args.name:
-        name_q = urllib.parse.quote(args.name)
-        skills = supabase_get(f"skills?name=eq.{name_q}&select={select}", service_key=True)
+        skills = supabase_get(f"skills?name=eq.{q(args.name)}&select={select}", service_key=True)
     else:
-        skills = supabase_get(f"skills?select={select}&order=name.asc", service_key=True)
-
-    if not skills:
-        print("No skills found.")
-        return
-
-    results = {"total": len(skills), "passed": 0, "failed": 0, "skills": []}
-
+        # Stream in pages — file_tree blobs make the full registry too big to hold at once
+        skills = supabase_iter(f"skills?select={select}&order=name.asc,variant.asc",
+                               page=100, service_key=True)
+
+    cache = load_scan_cache()
+    # A full-registry run sees every live file, so keep only what it used —
+    # content that was edited or deleted since the last run drops out
+    used = None if args.name else {}
+    audited = []
+    updates = []
     for skill in skills:
-        passed, findings = audit_skill(skill)
-        label = f"{skill['name']}@{skill['variant']}"
-
-        result = {
-            "name": skill["name"],
-            "variant": skill["variant"],
-            "passed": passed,
-            "finding_count": len(findings),
-            "previously_audited": skill.get("audited_at") is not None,
-        }
+        passed, findings = audit_skill(skill, verbose=args.verbose, cache=cache, used=used)
+        audited.append(build_result(skill, passed, findings, verbose=args.verbose))
+        updates.append({"p_skill_id": skill["id"], "p_passed": passed})
+    save_scan_cache(cache if used is None else used)
 
-        if args.verbose or not passed:
-            result["findings"] = findings
+    # Update database — one bulk RPC instead of a round-trip per skill
+    if updates and not args.dry_run:
+        supabase_rpc_batch("audit_skills_bulk", updates, service_key=True, exit_on_error=False)
 
-        results["skills"].append(result)
+    results = {"total": len(audited), "passed": 0, "failed": 0, "skills": audited}
 
-        if passed:
+    for result in audited:
+        if result["passed"]:
             results["passed"] += 1
         else:
             results["failed"] += 1
 
-        # Update database
         if not args.dry_run:
-            supabase_rpc("audit_skill", {
-                "p_skill_id": skill["id"],
-                "p_passed": passed,
-            }, service_key=True, exit_on_error=False)
-            status = "PASS" if passed else "FAIL"
-            print(f"  {status}: {label} ({len(findings)} findings)", file=sys.stderr)
+            status = "PASS" if result["passed"] else "FAIL"
+            label = f"{result['name']}@{result['variant']}"
+            print(f"  {status}: {label} ({result['finding_count']} findings)", file=sys.stderr)
+
+    if not results["total"]:
+        print("No skills found.")
+        return
 
     if args.dry_run:
         print(json.dumps(results, indent=2, ensure_ascii=False))
@@ -5,12 +5,13 @@ import argparse
 import json
 import os
 import sys
-import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 # Add scripts/ to path so lib/ is importable
 sys.path.insert(0, str(Path(__file__).resolve().parent))
-from lib.supabase import supabase_get, supabase_rpc
+from lib import find_skills_dir, safe_join
+from lib.supabase import clear_cache, q, supabase_get, supabase_rpc
 
 
 def parse_args():
@@ -23,16 +24,9 @@ def parse_args():
     return p.parse_args()
 
 
-def find_skills_dir(override=None):
-    if override:
-        return Path(override)
-    cwd = Path.cwd()
-    for d in [cwd, *cwd.parents]:
-        candidate = d / ".claude" / "skills"
-        if candidate.is_dir():
-            return candidate
-    print("ERROR: cannot find .claude/skills/ directory", file=sys.stderr)
-    sys.exit(1)
+def _write_file(item):
+    fpath, content = item
+    fpath.write_text(content, encoding="utf-8")
 
 
 def install_skill(name, variant, skills_dir, force=False, _visited=None):
@@ -55,10 +49,8 @@ def install_skill(name, variant, skills_dir, force=False, _visited=None):
         return {"status": "skipped", "name": name, "variant": variant, "reason": "already installed"}
 
     # Fetch skill from registry
-    name_q = urllib.parse.quote(name)
-    variant_q = urllib.parse.quote(variant)
     results = supabase_get(
-        f"skills?name=eq.{name_q}&variant=eq.{variant_q}&select=id,name,variant,skill_md,file_tree,requires_env,requires_runtime,depends_on"
+        f"skills?name=eq.{q(name)}&variant=eq.{q(variant)}&select=id,name,variant,skill_md,file_tree,requires_env,requires_runtime,depends_on"
     )
 
     if not results:
@@ -70,24 +62,29 @@ def install_skill(name, variant, skills_dir, force=False, _visited=None):
     if not file_tree:
         return {"status": "error", "name": name, "variant": variant, "reason": "no file_tree in registry"}
 
-    # Write files
+    # Validate every path first, then write — nothing touches disk if any path is rejected
     files_written = []
-    resolved_target = target_dir.resolve()
+    pending = []
+    resolved_target = str(target_dir.resolve())
     for rel_path, content in file_tree.items():
         if content.startswith("[binary file,"):
             print(f"WARNING: skipping binary file: {rel_path}", file=sys.stderr)
             continue
 
-        fpath = (target_dir / rel_path).resolve()
+        fpath = safe_join(resolved_target, rel_path)
         # Prevent path traversal — all files must stay inside target_dir
-        if not fpath.is_relative_to(resolved_target):
+        if fpath is None:
             print(f"ERROR: path traversal blocked: {rel_path}", file=sys.stderr)
             sys.exit(1)
 
-        fpath.parent.mkdir(parents=True, exist_ok=True)
-        fpath.write_text(content, encoding="utf-8")
+        pending.append((Path(fpath), content))
         files_written.append(rel_path)
 
+    for parent in {fpath.parent for fpath, _ in pending}:
+        parent.mkdir(parents=True, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=8) as ex:
+        list(ex.map(_write_file, pending))
+
     # Make scripts executable
     script_dir = target_dir / "scripts"
     if script_dir.is_dir():
@@ -97,6 +94,7 @@ def install_skill(name, variant, skills_dir, force=False, _visited=None):
 
     # Increment install count (best-effort)
     supabase_rpc("increment_installs", {"skill_id": skill["id"]}, exit_on_error=False)
+    clear_cache()
 
     # Check env dependencies
     missing_env = []
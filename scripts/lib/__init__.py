@@ -1,15 +1,94 @@
 """Skill Evolution shared library — auto-loads .env on import."""
 
+import json
 import os
+import re
+import sys
 from pathlib import Path
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Root of the skill-dev directory (scripts/../)
 SKILL_ROOT = Path(__file__).resolve().parent.parent.parent
 
+# Skill names and variants: lowercase alphanumeric + hyphens, 1-63 chars
+SLUG_RE = re.compile(r"\A[a-z0-9][a-z0-9\-]{0,62}\Z")
+
+
+def walk_files(root, skip_pycache=False, _prefix=""):
+    """Yield (relative_path, DirEntry) for every file under root.
+
+    os.scandir reuses the directory listing's file-type info, so unlike
+    rglob + is_file() there's no extra stat() per entry. Symlinked directories
+    are not descended. With skip_pycache, __pycache__ directories are pruned
+    without being listed and .pyc files are skipped.
+    """
+    with os.scandir(root) as it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                if not (skip_pycache and entry.name == "__pycache__"):
+                    yield from walk_files(entry.path, skip_pycache, f"{_prefix}{entry.name}{os.sep}")
+            elif entry.is_file() and not (skip_pycache and entry.name.endswith(".pyc")):
+                yield f"{_prefix}{entry.name}", entry
+
+
+def safe_join(resolved_target, rel_path):
+    """Join rel_path under resolved_target, or return None if it would escape it.
+
+    resolved_target must already be resolved (Path.resolve()). The check itself
+    is pure string normalization, so callers resolve once and check many paths
+    without a syscall per file.
+    """
+    fpath = os.path.normpath(os.path.join(resolved_target, rel_path))
+    if not fpath.startswith(resolved_target + os.sep):
+        return None
+    return fpath
+
+
+def find_skills_dir(override=None):
+    """Return the .claude/skills/ directory: override, else the nearest one above cwd.
+
+    The result is stored in SKILL_EVOLUTION_SKILLS_DIR, so later calls and
+    child scripts (e.g. merge.py running publish.py) skip the walk.
+    """
+    if override:
+        return Path(override)
+    cached = os.environ.get("SKILL_EVOLUTION_SKILLS_DIR")
+    if cached and os.path.isdir(cached):
+        return Path(cached)
+    cwd = Path.cwd()
+    for d in [cwd, *cwd.parents]:
+        candidate = d / ".claude" / "skills"
+        if candidate.is_dir():
+            os.environ["SKILL_EVOLUTION_SKILLS_DIR"] = str(candidate)
+            return candidate
+    print("ERROR: cannot find .claude/skills/ directory", file=sys.stderr)
+    sys.exit(1)
+
+
+# Set once .env has been loaded; inherited by child processes (e.g. merge.py
+# running publish.py) so they skip the directory walk.
+_DOTENV_SENTINEL = "SKILL_EVOLUTION_DOTENV_LOADED"
+_LOADED = False
+
 
 def _load_dotenv():
-    """Minimal .env loader: walk up from cwd to find .env, parse KEY=VALUE lines."""
-    for d in [Path.cwd(), *Path.cwd().parents]:
+    """Minimal .env loader: walk up from cwd to find .env, parse KEY=VALUE lines.
+
+    Runs at most once per process tree.
+    """
+    global _LOADED
+    if _LOADED or os.environ.get(_DOTENV_SENTINEL):
+        _LOADED = True
+        return
+    _LOADED = True
+    os.environ[_DOTENV_SENTINEL] = "1"
+
+    cwd = Path.cwd()
+    for d in [cwd, *cwd.parents]:
         env_file = d / ".env"
         if env_file.is_file():
             try:
@@ -57,4 +136,18 @@ def save_publisher_key(key):
     os.environ["PUBLISHER_KEY"] = key
 
 
+def print_json(obj):
+    """Write obj to stdout as indented (non-ASCII-escaped) JSON plus a newline.
+
+    Uses orjson when installed — several times faster on large reports.
+    """
+    if orjson is not None:
+        sys.stdout.flush()
+        sys.stdout.buffer.write(orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE | orjson.OPT_INDENT_2))
+        sys.stdout.buffer.flush()
+    else:
+        json.dump(obj, sys.stdout, indent=2, ensure_ascii=False)
+        sys.stdout.write("\n")
+
+
 _load_dotenv()
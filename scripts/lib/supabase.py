@@ -1,14 +1,35 @@
 """Shared Supabase client for Skill Evolution scripts."""
 
+import base64
+import gzip
+import hashlib
+import http.client
 import json
 import os
+import re
 import ssl
 import sys
-import urllib.error
+import threading
+import time
+import urllib.parse
 import urllib.request
+from pathlib import Path
 
 _TIMEOUT = 30  # seconds
 
+# orjson (optional) encodes/decodes large file_tree payloads several times
+# faster than stdlib json and works on bytes directly
+try:
+    import orjson
+
+    _dumps = orjson.dumps
+    _loads = orjson.loads
+except ImportError:
+    def _dumps(obj):
+        return json.dumps(obj).encode()
+
+    _loads = json.loads
+
 
 def _ssl_context():
     """Create SSL context with best-effort CA bundle resolution.
@@ -46,6 +67,106 @@ def _get_ssl_context():
         _CTX = _ssl_context()
     return _CTX
 
+
+# Keep-alive connections, one per (scheme, host) per thread — reused across
+# calls so each request doesn't pay a fresh TCP + TLS handshake.
+_local = threading.local()
+
+
+def _proxy_for(scheme, host):
+    """Proxy URL from HTTPS_PROXY/HTTP_PROXY (honouring NO_PROXY), or None — as urlopen did."""
+    proxy = urllib.request.getproxies().get(scheme)
+    if not proxy or urllib.request.proxy_bypass(host):
+        return None
+    return proxy if "://" in proxy else f"http://{proxy}"
+
+
+def _connection(scheme, netloc):
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get((scheme, netloc))
+    if conn is None:
+        host = urllib.parse.urlsplit(f"//{netloc}").hostname or netloc
+        proxy = _proxy_for(scheme, host)
+        if proxy:
+            # Connect to the proxy; HTTPS goes through a CONNECT tunnel so TLS
+            # (and certificate checks) still terminate at the real host
+            p = urllib.parse.urlsplit(proxy)
+            proxy_headers = {}
+            if p.username:
+                creds = f"{urllib.parse.unquote(p.username)}:{urllib.parse.unquote(p.password or '')}"
+                proxy_headers["Proxy-Authorization"] = "Basic " + base64.b64encode(creds.encode()).decode()
+            if scheme == "https":
+                conn = http.client.HTTPSConnection(p.hostname, p.port or 80, timeout=_TIMEOUT,
+                                                   context=_get_ssl_context())
+                conn.set_tunnel(netloc, headers=proxy_headers)
+            else:
+                conn = http.client.HTTPConnection(p.hostname, p.port or 80, timeout=_TIMEOUT)
+                conn.proxy_headers = proxy_headers
+        elif scheme == "https":
+            conn = http.client.HTTPSConnection(netloc, timeout=_TIMEOUT, context=_get_ssl_context())
+        else:
+            conn = http.client.HTTPConnection(netloc, timeout=_TIMEOUT)
+        conns[(scheme, netloc)] = conn
+    return conn
+
+
+_REDIRECTS = (301, 302, 303, 307, 308)
+_MAX_REDIRECTS = 5
+
+
+def _request(method, full_url, headers, body=None):
+    """Send a request over this thread's keep-alive connection.
+
+    Returns (status, response bytes). Responses are requested gzip-compressed
+    (JSON file_tree blobs shrink several-fold) and decompressed here. Retries
+    once if the server had already dropped a reused idle connection. Redirects
+    are followed the way urlopen follows them: GET keeps its method, POST is
+    re-sent as a body-less GET on 301/302/303 and not followed on 307/308.
+    """
+    headers = {**headers, "Accept-Encoding": "gzip"}
+    for _ in range(_MAX_REDIRECTS + 1):
+        status, location, data = _send(method, full_url, headers, body)
+        if status not in _REDIRECTS or not location:
+            return status, data
+        if method == "POST":
+            if status in (307, 308):
+                return status, data
+            method, body = "GET", None
+            headers = {k: v for k, v in headers.items() if k.lower() != "content-type"}
+        full_url = urllib.parse.urljoin(full_url, location)
+    return status, data
+
+
+def _send(method, full_url, headers, body):
+    """One request/response exchange; returns (status, Location header, bytes)."""
+    parts = urllib.parse.urlsplit(full_url)
+    conn = _connection(parts.scheme, parts.netloc)
+    if getattr(conn, "proxy_headers", None) is not None:
+        # Plain-HTTP proxy: absolute-form request target
+        target = full_url
+        headers = {**headers, **conn.proxy_headers}
+    else:
+        target = parts.path + (f"?{parts.query}" if parts.query else "")
+    for attempt in range(2):
+        reused = conn.sock is not None
+        try:
+            conn.request(method, target, body=body, headers=headers)
+            resp = conn.getresponse()
+            data = resp.read()
+            if resp.getheader("Content-Encoding") == "gzip":
+                data = gzip.decompress(data)
+            return resp.status, resp.getheader("Location"), data
+        except (ConnectionResetError, BrokenPipeError):
+            conn.close()
+            if not reused or attempt:
+                raise
+        except BaseException:
+            conn.close()
+            raise
+
+
 # Public registry defaults — users can override via env vars or .env
 _DEFAULT_URL = "https://ptwosnmrcfwmfnluufww.supabase.co"
 _DEFAULT_ANON_KEY = "sb_publishable_BNikqoeKRZEp2FSqAOJu4A_pJ0UBzby"
@@ -68,8 +189,23 @@ def _get_credentials(require_service_key=False):
     return url, key
 
 
-def supabase_get(path, service_key=False):
-    """Make a Supabase REST API GET request."""
+# Characters urllib.parse.quote leaves alone — plain skill names skip quoting
+_SAFE_RE = re.compile(r"\A[A-Za-z0-9._-]+\Z")
+
+
+def q(value):
+    """URL-quote a query value, returning it untouched when no escaping is needed."""
+    return value if _SAFE_RE.match(value) else urllib.parse.quote(value)
+
+
+def supabase_get(path, service_key=False, rows=None):
+    """Make a Supabase REST API GET request.
+
+    Args:
+        path: REST path + query string (after /rest/v1/)
+        service_key: use service_role key instead of anon key
+        rows: optional (first, last) inclusive row range, sent as a Range header
+    """
     url, key = _get_credentials(require_service_key=service_key)
 
     full_url = f"{url}/rest/v1/{path}"
@@ -77,18 +213,86 @@ def supabase_get(path, service_key=False):
         "apikey": key,
         "Authorization": f"Bearer {key}",
     }
+    if rows is not None:
+        headers["Range-Unit"] = "items"
+        headers["Range"] = f"{rows[0]}-{rows[1]}"
 
-    req = urllib.request.Request(full_url, headers=headers)
     try:
-        with urllib.request.urlopen(req, context=_get_ssl_context(), timeout=_TIMEOUT) as resp:
-            return json.loads(resp.read().decode())
-    except urllib.error.HTTPError as e:
-        body = e.read().decode()
-        print(f"ERROR: Supabase GET failed (status={e.code}): {body}", file=sys.stderr)
-        sys.exit(1)
-    except (urllib.error.URLError, OSError) as e:
+        status, data = _request("GET", full_url, headers)
+    except (OSError, http.client.HTTPException) as e:
         print(f"ERROR: Supabase GET network error: {e}", file=sys.stderr)
         sys.exit(1)
+    if status >= 400:
+        print(f"ERROR: Supabase GET failed (status={status}): {data.decode()}", file=sys.stderr)
+        sys.exit(1)
+    return _loads(data)
+
+
+# Short-lived on-disk cache for read-mostly lookups (skill ids, variant trees)
+_CACHE_DIR = Path.home() / ".cache" / "skill-evolution"
+
+
+def _prune_cache(max_age):
+    """Delete cache entries (and stray temp files) older than `max_age` seconds."""
+    cutoff = time.time() - max_age
+    try:
+        with os.scandir(_CACHE_DIR) as it:
+            for entry in it:
+                try:
+                    if entry.is_file() and entry.stat().st_mtime < cutoff:
+                        os.unlink(entry.path)
+                except OSError:
+                    pass
+    except OSError:
+        pass
+
+
+def clear_cache():
+    """Drop every cached response, e.g. after a write that changes the registry."""
+    _prune_cache(float("-inf"))
+
+
+def cached_supabase_get(path, ttl=60, service_key=False):
+    """supabase_get with an on-disk cache of responses younger than `ttl` seconds.
+
+    Entries are keyed by registry URL + path. Expired entries are pruned on
+    every cache miss, so the directory stays bounded by what was read recently.
+    """
+    url, _ = _get_credentials(require_service_key=service_key)
+    digest = hashlib.blake2b(f"{service_key}|{url}/{path}".encode(), digest_size=12).hexdigest()
+    cache_file = _CACHE_DIR / f"{digest}.json"
+    try:
+        entry = _loads(cache_file.read_bytes())
+        if time.time() - entry["ts"] < ttl:
+            return entry["body"]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+
+    _prune_cache(ttl)
+    results = supabase_get(path, service_key=service_key)
+    try:
+        _CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        tmp = cache_file.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_bytes(_dumps({"ts": time.time(), "body": results}))
+        os.replace(tmp, cache_file)
+    except OSError:
+        pass  # cache is best-effort
+    return results
+
+
+def supabase_iter(path, page=500, service_key=False):
+    """Yield rows of a GET request one page at a time.
+
+    Only one page is held in memory; iteration stops at the first short page.
+    The query should have a stable `order=` so pages don't overlap.
+    """
+    first = 0
+    while True:
+        rows = supabase_get(path, service_key=service_key, rows=(first, first + page - 1))
+        yield from rows
+        if len(rows) < page:
+            return
+        first += page
 
 
 def supabase_rpc(func_name, params, service_key=False, exit_on_error=True):
@@ -109,20 +313,27 @@ def supabase_rpc(func_name, params, service_key=False, exit_on_error=True):
         "Content-Type": "application/json",
     }
 
-    body = json.dumps(params).encode()
-    req = urllib.request.Request(full_url, data=body, headers=headers, method="POST")
+    body = _dumps(params)
     try:
-        with urllib.request.urlopen(req, context=_get_ssl_context(), timeout=_TIMEOUT) as resp:
-            text = resp.read().decode()
-            return json.loads(text) if text.strip() else None
-    except urllib.error.HTTPError as e:
-        err_body = e.read().decode()
-        print(f"ERROR: Supabase RPC {func_name} failed (status={e.code}): {err_body}", file=sys.stderr)
+        status, data = _request("POST", full_url, headers, body)
+    except (OSError, http.client.HTTPException) as e:
+        print(f"ERROR: Supabase RPC {func_name} network error: {e}", file=sys.stderr)
         if exit_on_error:
             sys.exit(1)
         return None
-    except (urllib.error.URLError, OSError) as e:
-        print(f"ERROR: Supabase RPC {func_name} network error: {e}", file=sys.stderr)
+    if status >= 400:
+        print(f"ERROR: Supabase RPC {func_name} failed (status={status}): {data.decode()}", file=sys.stderr)
         if exit_on_error:
             sys.exit(1)
         return None
+    return _loads(data) if data.strip() else None
+
+
+def supabase_rpc_batch(func_name, params_list, service_key=False, exit_on_error=True):
+    """Call a bulk RPC function once for many rows.
+
+    The function takes a single jsonb argument `p_rows`: a list of the same
+    param dicts its single-row counterpart accepts.
+    """
+    return supabase_rpc(func_name, {"p_rows": params_list},
+                        service_key=service_key, exit_on_error=exit_on_error)
@@ -3,13 +3,15 @@
 
 import argparse
 import json
+import os
 import sys
 import tempfile
-import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).resolve().parent))
-from lib.supabase import supabase_get
+from lib import SLUG_RE, print_json, safe_join, walk_files
+from lib.supabase import cached_supabase_get, q
 
 
 def parse_args():
@@ -41,9 +43,9 @@ def parse_args():
 
 def fetch_variant(name, variant):
     """Fetch a skill variant from the registry. Returns dict or exits."""
-    name_q = urllib.parse.quote(name)
-    variant_q = urllib.parse.quote(variant)
-    results = supabase_get(
+    name_q = q(name)
+    variant_q = q(variant)
+    results = cached_supabase_get(
         f"skills?name=eq.{name_q}&variant=eq.{variant_q}"
         f"&select=id,name,variant,author,description,tags,skill_md,file_tree,depends_on"
     )
@@ -62,29 +64,80 @@ def write_variant(skill, target_dir):
     if isinstance(file_tree, str):
         file_tree = json.loads(file_tree)
 
+    resolved_target = str(target.resolve())
+    pending = []
     for rel_path, content in file_tree.items():
-        fpath = target / rel_path
+        fpath = safe_join(resolved_target, rel_path)
         # Path traversal protection
-        if not fpath.resolve().is_relative_to(target.resolve()):
+        if fpath is None:
             print(f"WARNING: skipping path traversal attempt: {rel_path}", file=sys.stderr)
             continue
-        fpath.parent.mkdir(parents=True, exist_ok=True)
+        pending.append((rel_path, Path(fpath), content))
+
+    for parent in {fpath.parent for _, fpath, _ in pending}:
+        parent.mkdir(parents=True, exist_ok=True)
+    for rel_path, fpath, content in pending:
         if not isinstance(content, str) or content.startswith("[binary file,"):
             continue
-        fpath.write_text(content, encoding="utf-8")
-        if rel_path.startswith("scripts/"):
-            fpath.chmod(0o755)
+        fd = os.open(fpath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+        try:
+            # On the open fd, so rewriting an existing workspace still makes scripts executable
+            if rel_path.startswith("scripts/"):
+                os.fchmod(fd, 0o755)
+            data = memoryview(content.encode("utf-8"))
+            while data:
+                data = data[os.write(fd, data):]
+        finally:
+            os.close(fd)
 
     return sorted(file_tree.keys())
 
 
+def _same_bytes(entry_a, entry_b, chunk_size=65536):
+    """Byte-compare two files: sizes first, then 64 KiB chunks until they differ."""
+    if entry_a.stat().st_size != entry_b.stat().st_size:
+        return False
+    with open(entry_a.path, "rb") as fa, open(entry_b.path, "rb") as fb:
+        while True:
+            chunk_a = fa.read(chunk_size)
+            if chunk_a != fb.read(chunk_size):
+                return False
+            if not chunk_a:
+                return True
+
+
+def _read_lf(path):
+    with open(path, "rb") as f:
+        return f.read().replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+
+
+def _same_content(entry_a, entry_b):
+    """True if two files match, ignoring CRLF/CR vs LF line endings."""
+    if _same_bytes(entry_a, entry_b):
+        return True
+    return _read_lf(entry_a.path) == _read_lf(entry_b.path)
+
+
+def _quick_diff_stats(path_a, path_b):
+    """Count distinct lines added/removed between two files.
+
+    A set difference over lines — O(n), unlike difflib's LCS matching, which
+    degrades badly on large files. Moved or duplicated lines aren't counted;
+    read both files when the exact edit matters.
+    """
+    with open(path_a, "rb") as fa, open(path_b, "rb") as fb:
+        lines_a = set(fa.read().splitlines())
+        lines_b = set(fb.read().splitlines())
+    return {"added": len(lines_b - lines_a), "removed": len(lines_a - lines_b)}
+
+
 def compute_diff(dir_a, dir_b, label_a, label_b):
     """Compare two variant directories and classify each file."""
     path_a = Path(dir_a)
     path_b = Path(dir_b)
 
-    files_a = {str(f.relative_to(path_a)) for f in path_a.rglob("*") if f.is_file()}
-    files_b = {str(f.relative_to(path_b)) for f in path_b.rglob("*") if f.is_file()}
+    files_a = dict(walk_files(path_a))
+    files_b = dict(walk_files(path_b))
 
     all_files = sorted(files_a | files_b)
     report = {"complementary": [], "conflicting": [], "redundant": [], "only_a": [], "only_b": []}
@@ -98,9 +151,7 @@ def compute_diff(dir_a, dir_b, label_a, label_b):
         elif in_b and not in_a:
             report["only_b"].append(f)
         else:
-            content_a = (path_a / f).read_text(encoding="utf-8", errors="replace")
-            content_b = (path_b / f).read_text(encoding="utf-8", errors="replace")
-            if content_a == content_b:
+            if _same_content(files_a[f], files_b[f]):
                 report["redundant"].append(f)
             else:
                 # Both modified the same file differently
@@ -127,6 +178,9 @@ def compute_diff(dir_a, dir_b, label_a, label_b):
         output["conflicting"] = {
             "description": "Same file modified differently — agent must decide which version to keep or how to merge",
             "files": report["conflicting"],
+            "line_changes": {
+                f: _quick_diff_stats(files_a[f].path, files_b[f].path) for f in report["conflicting"]
+            },
         }
     if report["redundant"]:
         output["redundant"] = {
@@ -145,11 +199,19 @@ def cmd_prepare(args):
 
     var_a, var_b = variants
 
-    # Fetch both variants
-    print(f"Fetching {args.name}@{var_a}...", file=sys.stderr)
-    skill_a = fetch_variant(args.name, var_a)
-    print(f"Fetching {args.name}@{var_b}...", file=sys.stderr)
-    skill_b = fetch_variant(args.name, var_b)
+    def fetch(variant):
+        print(f"Fetching {args.name}@{variant}...", file=sys.stderr)
+        return fetch_variant(args.name, variant)
+
+    def write(variant, skill, target_dir):
+        print(f"Writing {variant} to {target_dir}...", file=sys.stderr)
+        return write_variant(skill, target_dir)
+
+    # Fetch both variants concurrently — two independent round-trips
+    with ThreadPoolExecutor(max_workers=2) as ex:
+        fa = ex.submit(fetch, var_a)
+        fb = ex.submit(fetch, var_b)
+        skill_a, skill_b = fa.result(), fb.result()
 
     # Create workspace
     if args.workspace:
@@ -163,11 +225,11 @@ def cmd_prepare(args):
     merged_dir = workspace / "merged"
     merged_dir.mkdir(parents=True, exist_ok=True)
 
-    # Write both variants
-    print(f"Writing {var_a} to {dir_a}...", file=sys.stderr)
-    files_a = write_variant(skill_a, dir_a)
-    print(f"Writing {var_b} to {dir_b}...", file=sys.stderr)
-    files_b = write_variant(skill_b, dir_b)
+    # Write both variants (separate target dirs, so safe in parallel)
+    with ThreadPoolExecutor(max_workers=2) as ex:
+        fa = ex.submit(write, var_a, skill_a, dir_a)
+        fb = ex.submit(write, var_b, skill_b, dir_b)
+        files_a, files_b = fa.result(), fb.result()
 
     # Compute diff
     diff_report = compute_diff(dir_a, dir_b, f"{args.name}@{var_a}", f"{args.name}@{var_b}")
@@ -189,7 +251,7 @@ def cmd_prepare(args):
             f"5. Run: merge.py publish --workspace {merged_dir} --name {args.name} --variant merged --yes",
         ],
     }
-    print(json.dumps(output, indent=2, ensure_ascii=False))
+    print_json(output)
 
 
 def cmd_diff(args):
@@ -203,13 +265,12 @@ def cmd_diff(args):
         sys.exit(1)
 
     report = compute_diff(dir_a, dir_b, str(dir_a), str(dir_b))
-    print(json.dumps(report, indent=2, ensure_ascii=False))
+    print_json(report)
 
 
 def cmd_publish(args):
     """Publish merged skill by invoking publish.py on the workspace."""
-    import re
-    if not re.match(r'^[a-z0-9][a-z0-9\-]{0,62}$', args.name):
+    if not SLUG_RE.match(args.name):
         print(f"ERROR: invalid skill name: {args.name}", file=sys.stderr)
         sys.exit(1)
     workspace = Path(args.workspace)
@@ -222,37 +283,23 @@ def cmd_publish(args):
         print(f"ERROR: SKILL.md not found in {workspace}. Write the merged SKILL.md first.", file=sys.stderr)
         sys.exit(1)
 
-    # Invoke publish.py with the workspace as skills-dir parent
-    # publish.py expects skills-dir/<skill-name>/ structure
+    # Invoke publish.py on the workspace directory directly — its name
+    # doesn't need to match the skill name
     publish_script = Path(__file__).resolve().parent / "publish.py"
     import subprocess
     cmd = [
         sys.executable, str(publish_script),
         "--skill-name", args.name,
         "--variant", args.variant,
-        "--skills-dir", str(workspace.parent),
+        "--skill-dir", str(workspace),
     ]
-    # The workspace dir name must match the skill name for publish.py to find it
-    # If it doesn't, create a symlink
-    expected_dir = workspace.parent / args.name
-    created_link = False
-    if workspace.name != args.name and not expected_dir.exists():
-        expected_dir.symlink_to(workspace)
-        created_link = True
-
     if args.yes:
         cmd.append("--yes")
 
-    try:
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        if result.stdout:
-            print(result.stdout, end="")
-        if result.stderr:
-            print(result.stderr, end="", file=sys.stderr)
-        sys.exit(result.returncode)
-    finally:
-        if created_link and expected_dir.is_symlink():
-            expected_dir.unlink()
+    # Child inherits our stdout/stderr, so its output streams straight through
+    sys.stdout.flush()
+    result = subprocess.run(cmd)
+    sys.exit(result.returncode)
 
 
 def main():
@@ -6,13 +6,15 @@ import json
 import os
 import re
 import sys
-import urllib.parse
+from functools import lru_cache
 from pathlib import Path
 
 # Add scripts/ to path so lib/ is importable
 sys.path.insert(0, str(Path(__file__).resolve().parent))
-from lib import get_publisher_key, save_publisher_key
-from lib.supabase import supabase_get, supabase_rpc
+from lib import (
+    SLUG_RE, find_skills_dir, get_publisher_key, print_json, save_publisher_key, walk_files,
+)
+from lib.supabase import clear_cache, supabase_rpc
 
 
 def parse_args():
@@ -21,23 +23,13 @@ def parse_args():
     p.add_argument("--variant", default="base", help="Variant name (default: base, use author name for forks)")
     p.add_argument("--author", default=None, help="Author identifier (default: from git config)")
     p.add_argument("--skills-dir", default=None, help="Path to .claude/skills/ (auto-detected)")
+    p.add_argument("--skill-dir", default=None,
+                   help="Path to the skill directory itself (overrides --skills-dir/--skill-name lookup)")
     p.add_argument("--yes", action="store_true", help="Actually publish (without this flag, only preview is shown)")
     return p.parse_args()
 
 
-def find_skills_dir(override=None):
-    if override:
-        return Path(override)
-    # Walk up from cwd looking for .claude/skills/
-    cwd = Path.cwd()
-    for d in [cwd, *cwd.parents]:
-        candidate = d / ".claude" / "skills"
-        if candidate.is_dir():
-            return candidate
-    print("ERROR: cannot find .claude/skills/ directory", file=sys.stderr)
-    sys.exit(1)
-
-
+@lru_cache(maxsize=1)
 def get_author():
     import subprocess
     try:
@@ -54,11 +46,24 @@ def parse_frontmatter(skill_md_text):
     Lightweight parser for simple key: value and key: [list] fields.
     No external dependencies (replaces PyYAML).
     """
-    m = re.match(r"^---\s*\n(.*?)\n---\s*\n", skill_md_text, re.DOTALL)
-    if not m:
+    text = skill_md_text
+    # Opening fence: "---" alone on the first line
+    open_nl = text.find("\n")
+    if not text.startswith("---") or open_nl < 0 or text[3:open_nl].strip():
+        return {}
+    # Closing fence: the next line that is "---" followed only by whitespace
+    end = text.find("\n---", open_nl + 1)
+    while end >= 0:
+        eol = text.find("\n", end + 4)
+        if eol < 0:
+            return {}
+        if not text[end + 4:eol].strip():
+            break
+        end = text.find("\n---", end + 1)
+    if end < 0:
         return {}
     result = {}
-    for line in m.group(1).splitlines():
+    for line in text[open_nl + 1:end].splitlines():
         line = line.strip()
         if not line or line.startswith("#"):
             continue
@@ -79,39 +84,79 @@ def parse_frontmatter(skill_md_text):
     return result
 
 
-def collect_file_tree(skill_dir):
-    """Collect all files in the skill directory into a flat dict {relative_path: content}."""
+# Always stored as a placeholder — no need to read them
+_BIN_SUFFIXES = frozenset({
+    ".png", ".jpg", ".jpeg", ".gif", ".webp", ".ico", ".pdf",
+    ".zip", ".gz", ".tar", ".wasm", ".so", ".dylib", ".dll",
+})
+
+
+def _read_text_file(fpath):
+    """Return a file's UTF-8 text, or None if it looks binary (NUL in the first 8 KB or undecodable).
+
+    Line endings are normalized to \n, matching Path.read_text()'s universal newlines.
+    """
+    with open(fpath, "rb") as f:
+        head = f.read(8192)
+        if b"\x00" in head:
+            return None
+        try:
+            text = (head + f.read()).decode("utf-8")
+        except UnicodeDecodeError:
+            return None
+    return text.replace("\r\n", "\n").replace("\r", "\n")
+
+
+class _TooBig(Exception):
+    """Raised by collect_file_tree when a skill exceeds the publish size limits."""
+
+
+def collect_file_tree(skill_dir, max_files=50, max_bytes=500_000):
+    """Collect all files in the skill directory into a flat dict {relative_path: content}.
+
+    Raises _TooBig as soon as the file count or total content size is over the
+    limit, without reading the remaining files.
+    """
     tree = {}
-    for fpath in sorted(skill_dir.rglob("*")):
-        if fpath.is_file():
-            rel = str(fpath.relative_to(skill_dir))
-            # Skip __pycache__, .pyc, etc
-            if "__pycache__" in rel or rel.endswith(".pyc"):
-                continue
-            try:
-                tree[rel] = fpath.read_text(encoding="utf-8")
-            except UnicodeDecodeError:
-                # Binary file — store placeholder
-                tree[rel] = f"[binary file, {fpath.stat().st_size} bytes]"
+    total_size = 0
+    # Sort by path components, matching the order sorted(rglob()) used to give
+    files = sorted(walk_files(skill_dir, skip_pycache=True), key=lambda item: item[0].split(os.sep))
+    if len(files) > max_files:
+        raise _TooBig(f"too many files ({len(files)}, max {max_files})")
+    for rel, entry in files:
+        content = None
+        if os.path.splitext(entry.name)[1].lower() not in _BIN_SUFFIXES:
+            content = _read_text_file(entry.path)
+        if content is None:
+            # Binary file — store placeholder
+            content = f"[binary file, {entry.stat().st_size} bytes]"
+        total_size += len(content)
+        if total_size > max_bytes:
+            raise _TooBig(f"total content too large (at least {total_size} bytes, max {max_bytes // 1000}KB)")
+        tree[rel] = content
     return tree
 
 
+SANITIZE_PATTERNS = [
+    (re.compile(r"(?:sk|api|token|key|secret|password)[-_]?\w*\s*[:=]\s*['\"]?[A-Za-z0-9_\-]{20,}", re.IGNORECASE),
+     "possible API key/secret"),
+    (re.compile(r"/home/\w+/", re.IGNORECASE), "hardcoded home path"),
+]
+
+# Matches containing any of these are placeholders/env references, not real secrets
+_SANITIZE_FALSE_POSITIVES = ("SUPABASE", "TASKPOOL", "$HOME", "${HOME}")
+
+
 def sanitize_check(file_tree):
     """Check for secrets/hardcoded paths. Returns list of warnings."""
     warnings = []
-    secret_patterns = [
-        (r"(?:sk|api|token|key|secret|password)[-_]?\w*\s*[:=]\s*['\"]?[A-Za-z0-9_\-]{20,}", "possible API key/secret"),
-        (r"/home/\w+/", "hardcoded home path"),
-    ]
     for path, content in file_tree.items():
-        for pattern, desc in secret_patterns:
-            matches = re.findall(pattern, content, re.IGNORECASE)
-            if matches:
-                for m in matches:
-                    # Skip common false positives
-                    if "SUPABASE" in m or "TASKPOOL" in m or "$HOME" in m or "${HOME}" in m:
-                        continue
-                    warnings.append(f"{path}: {desc} — {m[:60]}")
+        for pattern, desc in SANITIZE_PATTERNS:
+            for m in pattern.findall(content):
+                # Skip common false positives
+                if any(fp in m for fp in _SANITIZE_FALSE_POSITIVES):
+                    continue
+                warnings.append(f"{path}: {desc} — {m[:60]}")
     return warnings
 
 
@@ -125,6 +170,10 @@ def extract_tags(description, name):
     return sorted(tags)
 
 
+# Env vars: os.environ["X"], os.getenv("X")
+_REQ_RE = re.compile(r'os\.(?:environ|getenv)\s*[\[(]\s*["\'](\w+)')
+
+
 def extract_requires(file_tree):
     """Scan scripts for env var requirements and runtime dependencies."""
     env_vars = set()
@@ -132,13 +181,14 @@ def extract_requires(file_tree):
     for path, content in file_tree.items():
         if not path.startswith("scripts/"):
             continue
-        # Env vars: os.environ["X"], os.getenv("X"), $X
-        for m in re.findall(r'os\.(?:environ|getenv)\s*[\[(]\s*["\'](\w+)', content):
-            if not m.startswith("TASKPOOL_"):
-                env_vars.add(m)
+        for m in _REQ_RE.finditer(content):
+            name = m.group(1)
+            if not name.startswith("TASKPOOL_"):
+                env_vars.add(name)
         # Runtime: shebang
         if content.startswith("#!/"):
-            first_line = content.split("\n")[0]
+            nl = content.find("\n")
+            first_line = content if nl < 0 else content[:nl]
             if "python" in first_line:
                 runtimes.add("uv")
             elif "node" in first_line:
@@ -167,8 +217,10 @@ def ensure_publisher_key(author):
 
 def main():
     args = parse_args()
-    skills_dir = find_skills_dir(args.skills_dir)
-    skill_dir = skills_dir / args.skill_name
+    if args.skill_dir:
+        skill_dir = Path(args.skill_dir)
+    else:
+        skill_dir = find_skills_dir(args.skills_dir) / args.skill_name
 
     if not skill_dir.is_dir():
         print(f"ERROR: skill directory not found: {skill_dir}", file=sys.stderr)
@@ -190,18 +242,22 @@ def main():
         sys.exit(1)
 
     # Input validation — prevent oversized or malformed payloads
-    if not re.match(r'^[a-z0-9][a-z0-9\-]{0,62}$', name):
+    if not SLUG_RE.match(name):
         print(f"ERROR: invalid skill name '{name}' — must be lowercase alphanumeric + hyphens, 1-63 chars", file=sys.stderr)
         sys.exit(1)
-    if not re.match(r'^[a-z0-9][a-z0-9\-]{0,62}$', args.variant):
+    if not SLUG_RE.match(args.variant):
         print(f"ERROR: invalid variant '{args.variant}' — must be lowercase alphanumeric + hyphens, 1-63 chars", file=sys.stderr)
         sys.exit(1)
     if len(description) > 1000:
         print(f"ERROR: description too long ({len(description)} chars, max 1000)", file=sys.stderr)
         sys.exit(1)
 
-    # Collect files
-    file_tree = collect_file_tree(skill_dir)
+    # Collect files (size limits are enforced while reading)
+    try:
+        file_tree = collect_file_tree(skill_dir)
+    except _TooBig as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        sys.exit(1)
 
     # Quality checks
     line_count = len(skill_md.splitlines())
@@ -215,15 +271,6 @@ def main():
         for w in warnings:
             print(f"  - {w}", file=sys.stderr)
 
-    # Validate file_tree size
-    total_size = sum(len(v) for v in file_tree.values())
-    if len(file_tree) > 50:
-        print(f"ERROR: too many files ({len(file_tree)}, max 50)", file=sys.stderr)
-        sys.exit(1)
-    if total_size > 500_000:
-        print(f"ERROR: total content too large ({total_size} bytes, max 500KB)", file=sys.stderr)
-        sys.exit(1)
-
     # Extract metadata
     author = args.author or get_author()
     tags = extract_tags(description, name)
@@ -265,32 +312,18 @@ def main():
     if not args.yes:
         preview["action"] = "preview"
         preview["hint"] = "Re-run with --yes to publish"
-        print(json.dumps(preview, indent=2, ensure_ascii=False))
+        print_json(preview)
         return
 
     # Authenticate publisher (auto-registers on first publish)
     publisher_key = ensure_publisher_key(author)
 
-    # Determine variant — fork logic: if another author's base exists, use author as variant
-    actual_variant = args.variant
-    parent_id = None
-    name_q = urllib.parse.quote(name)
-    variant_q = urllib.parse.quote(args.variant)
-    existing = supabase_get(
-        f"skills?name=eq.{name_q}&variant=eq.{variant_q}&select=id,author"
-    )
-
-    if existing and existing[0]["author"] != author:
-        # Fork: use author name as variant
-        actual_variant = author
-        parent_id = existing[0]["id"]
-        # Increment fork counter on the parent skill (best-effort)
-        supabase_rpc("increment_forks", {"skill_id": parent_id}, exit_on_error=False)
-
-    # Build RPC params (match publish_skill function signature)
+    # Build RPC params (match publish_skill function signature).
+    # Fork logic runs server-side: if another author owns name+variant, the
+    # skill is published with the author as variant and the fork is counted.
     rpc_params = {
         "p_name": name,
-        "p_variant": actual_variant,
+        "p_variant": args.variant,
         "p_description": description,
         "p_author": author,
         "p_api_key": publisher_key,
@@ -301,12 +334,13 @@ def main():
         "p_requires_tools": [],
         "p_requires_runtime": requires_runtime,
         "p_depends_on": fm.get("depends_on", []) or [],
+        "p_fork_on_conflict": True,
     }
-    if parent_id:
-        rpc_params["p_parent_id"] = parent_id
 
     # Publish via server-side RPC (uses anon key, no service key needed)
     result = supabase_rpc("publish_skill", rpc_params) or {}
+    clear_cache()  # so a follow-up search / merge prepare sees the new version
+    actual_variant = result.get("variant", args.variant)
 
     output = {
         "status": "ok",
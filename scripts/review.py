@@ -4,14 +4,17 @@
 import argparse
 import json
 import os
+import re
 import sys
-import urllib.parse
+from collections import defaultdict
 from pathlib import Path
 
 # Add scripts/ to path so lib/ is importable
 sys.path.insert(0, str(Path(__file__).resolve().parent))
-from lib import get_publisher_key
-from lib.supabase import supabase_get, supabase_rpc
+from lib import get_publisher_key, print_json
+from lib.supabase import cached_supabase_get, q, supabase_get, supabase_iter, supabase_rpc
+
+_UUID_RE = re.compile(r"\A[0-9a-f\-]{36}\Z")
 
 
 def parse_args():
@@ -42,15 +45,23 @@ def parse_args():
 
 def get_skill_id(name, variant="base"):
     """Look up skill ID by name and variant."""
-    name_q = urllib.parse.quote(name)
-    variant_q = urllib.parse.quote(variant)
-    results = supabase_get(f"skills?name=eq.{name_q}&variant=eq.{variant_q}&select=id")
+    name_q = q(name)
+    variant_q = q(variant)
+    results = cached_supabase_get(f"skills?name=eq.{name_q}&variant=eq.{variant_q}&select=id")
     if not results:
         print(f"ERROR: skill not found: {name}@{variant}", file=sys.stderr)
         sys.exit(1)
     return results[0]["id"]
 
 
+def validate_skill_ids(skill_ids):
+    """Exit unless every ID is UUID-shaped — they're interpolated into PostgREST filters."""
+    for sid in skill_ids:
+        if not _UUID_RE.match(sid):
+            print(f"ERROR: invalid skill ID format: {sid}", file=sys.stderr)
+            sys.exit(1)
+
+
 def cmd_submit(args):
     skill_id = get_skill_id(args.skill_name, args.variant)
     publisher_key = get_publisher_key()
@@ -75,11 +86,11 @@ def cmd_submit(args):
 
 
 def cmd_list(args):
-    name_q = urllib.parse.quote(args.skill_name)
+    name_q = q(args.skill_name)
 
     # Get skill IDs for this name
-    variant_filter = f"&variant=eq.{urllib.parse.quote(args.variant)}" if args.variant else ""
-    skills = supabase_get(f"skills?name=eq.{name_q}{variant_filter}&select=id,variant")
+    variant_filter = f"&variant=eq.{q(args.variant)}" if args.variant else ""
+    skills = cached_supabase_get(f"skills?name=eq.{name_q}{variant_filter}&select=id,variant")
     if not skills:
         print(json.dumps({"status": "not_found", "name": args.skill_name}))
         return
@@ -87,12 +98,7 @@ def cmd_list(args):
     limit = min(args.limit, 100)
     skill_ids = [s["id"] for s in skills]
 
-    # Validate IDs are UUIDs to prevent PostgREST injection
-    import re as _re
-    for sid in skill_ids:
-        if not _re.match(r'^[0-9a-f\-]{36}$', sid):
-            print(f"ERROR: invalid skill ID format: {sid}", file=sys.stderr)
-            sys.exit(1)
+    validate_skill_ids(skill_ids)
 
     reviews = supabase_get(
         f"skill_reviews?skill_id=in.({','.join(skill_ids)})&order=created_at.desc&limit={limit}&select=score,review_text,task_context,reviewer,created_at"
@@ -103,22 +109,30 @@ def cmd_list(args):
         "review_count": len(reviews),
         "reviews": reviews,
     }
-    print(json.dumps(output, indent=2, ensure_ascii=False))
+    print_json(output)
 
 
 def cmd_stats(args):
-    name_q = urllib.parse.quote(args.skill_name)
+    name_q = q(args.skill_name)
     skills = supabase_get(f"skills?name=eq.{name_q}&select=id,variant,installs")
     if not skills:
         print(json.dumps({"status": "not_found", "name": args.skill_name}))
         return
 
+    # One query for every variant's reviews, bucketed by skill_id client-side.
+    # Paged so PostgREST's max-rows cap can't silently truncate popular skills.
+    skill_ids = [s["id"] for s in skills]
+    validate_skill_ids(skill_ids)
+    reviews = supabase_iter(
+        f"skill_reviews?skill_id=in.({','.join(skill_ids)})&select=skill_id,score&order=id.asc"
+    )
+    scores_by_skill = defaultdict(list)
+    for r in reviews:
+        scores_by_skill[r["skill_id"]].append(r["score"])
+
     all_reviews = []
     for skill in skills:
-        reviews = supabase_get(
-            f"skill_reviews?skill_id=eq.{skill['id']}&select=score"
-        )
-        scores = [r["score"] for r in reviews]
+        scores = scores_by_skill[skill["id"]]
         skill["review_count"] = len(scores)
         skill["avg_score"] = round(sum(scores) / len(scores), 1) if scores else None
         all_reviews.extend(scores)
@@ -138,7 +152,7 @@ def cmd_stats(args):
             for s in skills
         ],
     }
-    print(json.dumps(output, indent=2, ensure_ascii=False))
+    print_json(output)
 
 
 def main():
@@ -2,15 +2,18 @@
 """Search the Skill Evolution registry for community skills."""
 
 import argparse
+import base64
 import json
 import re
 import sys
 import urllib.parse
+from operator import itemgetter
 from pathlib import Path
 
 # Add scripts/ to path so lib/ is importable
 sys.path.insert(0, str(Path(__file__).resolve().parent))
-from lib.supabase import supabase_get, supabase_rpc
+from lib import print_json
+from lib.supabase import cached_supabase_get, supabase_get
 
 
 def parse_args():
@@ -18,96 +21,161 @@ def parse_args():
     p.add_argument("--query", "-q", default=None, help="Search keywords")
     p.add_argument("--tag", "-t", default=None, help="Filter by tag")
     p.add_argument("--limit", type=int, default=10, help="Max results (default: 10)")
-    p.add_argument("--offset", type=int, default=0, help="Skip first N results for pagination (default: 0)")
+    p.add_argument("--offset", type=int, default=0, help="Skip first N results (default: 0; prefer --cursor for paging)")
+    p.add_argument("--cursor", default=None, help="Resume after the last row of a previous page (next_cursor from its output)")
     p.add_argument("--sort", choices=["installs", "updated", "name"], default="installs", help="Sort order (default: installs)")
     p.add_argument("--detail", default=None, help="Show full detail for a specific skill name")
+    p.add_argument("--full", action="store_true", help="With --detail, include each variant's SKILL.md text")
     p.add_argument("--list-all", action="store_true", help="List all skills (no search filter)")
     p.add_argument("--include-unaudited", action="store_true", help="Include skills that haven't passed security audit")
     return p.parse_args()
 
 
+# sort -> (column, direction); rows (one per skill name) are tie-broken by
+# name so the order is total and keyset pagination can resume after any row
 SORT_MAP = {
-    "installs": "installs.desc",
-    "updated": "updated_at.desc",
-    "name": "name.asc",
+    "installs": ("installs", "desc"),
+    "updated": ("updated_at", "desc"),
+    "name": ("name", "asc"),
 }
 
 
-def search_skills(query=None, tag=None, limit=10, offset=0, sort="installs", audited_only=True):
-    """Search skills using full-text search, or list all if no query."""
-    order = SORT_MAP.get(sort, "installs.desc")
+# Characters stripped from --query before it becomes a tsquery
+_FTS_SAN = re.compile(r"[^\w\u4e00-\u9fff\s]")
+
+# PostgREST operator syntax (installs.desc, cs.{tag}, ...) — fine unescaped
+_QS_SAFE = ".:{},*"
+
+
+def encode_cursor(row, sort="installs"):
+    """Opaque cursor pointing just past `row` in the given sort order."""
+    column, _ = SORT_MAP.get(sort, SORT_MAP["installs"])
+    raw = json.dumps({"v": row[column], "n": row["name"]})
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _keyset_filter(cursor, sort):
+    """PostgREST or=(...) filter selecting rows strictly after the cursor."""
+    try:
+        pos = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        value, name = pos["v"], pos["n"]
+    except (ValueError, TypeError, KeyError):
+        print(f"ERROR: invalid --cursor: {cursor}", file=sys.stderr)
+        sys.exit(1)
+    column, direction = SORT_MAP.get(sort, SORT_MAP["installs"])
+    if column == "name":
+        return f'(name.gt."{name}")'
+    op = "lt" if direction == "desc" else "gt"
+    return f'({column}.{op}."{value}",and({column}.eq."{value}",name.gt."{name}"))'
+
+
+def search_skills(query=None, tag=None, limit=10, offset=0, sort="installs", audited_only=True, cursor=None):
+    """Search skills using full-text search, or list all if no query.
+
+    Returns one row per skill name (see skills_top_variant in setup.sql): the
+    top matching variant for this sort (newest for "updated", else most
+    installed) plus `variants`, all matching variant names.
+    With `cursor`, returns the page after that row (keyset pagination) and
+    `offset` is ignored.
+    """
+    column, direction = SORT_MAP.get(sort, SORT_MAP["installs"])
+    order = f"{column}.{direction}" if column == "name" else f"{column}.{direction},name.asc"
 
     params = {
-        "select": "name,variant,description,author,installs,forks,tags,audited_at,created_at,updated_at",
+        "select": "name,top_variant,description,author,installs,tags,audited_at,updated_at,variants",
         "order": order,
         "limit": str(limit),
-        "offset": str(offset),
+        "p_audited_only": "true" if audited_only else "false",
+        "p_sort": sort,
     }
-
-    if audited_only:
-        params["audited_at"] = "not.is.null"
+    if cursor:
+        params["or"] = _keyset_filter(cursor, sort)
+    else:
+        params["offset"] = str(offset)
 
     if query:
         # Allowlist: keep only alphanumeric, CJK, and whitespace to prevent tsquery injection
-        sanitized = re.sub(r'[^\w\u4e00-\u9fff\s]', ' ', query)
-        words = [w for w in sanitized.strip().split() if w]
-        if words:
-            fts_query = " & ".join(words)
-            params["fts"] = f"fts.{fts_query}"
+        sanitized = _FTS_SAN.sub(" ", query)
+        # Lowercased, deduplicated and sorted: to_tsquery folds case and & is
+        # commutative, so "Web scraper?" and "scraper web" share one cache entry
+        words = sorted(set(sanitized.lower().split()))
+        if not words:
+            # Nothing searchable left (e.g. "???") — don't fall through to an unfiltered listing
+            return []
+        params["p_fts"] = " & ".join(words)
 
     if tag:
-        params["tags"] = f"cs.{{{tag}}}"
+        params["p_tag"] = tag
+
+    query_string = urllib.parse.urlencode(params, safe=_QS_SAFE, quote_via=urllib.parse.quote)
+    return cached_supabase_get(f"rpc/skills_top_variant?{query_string}")
 
-    query_string = "&".join(f"{k}={urllib.parse.quote(str(v))}" for k, v in params.items())
-    return supabase_get(f"skills?{query_string}")
 
+def get_skill_detail(name, full=False):
+    """Get all variants of a skill by name.
 
-def get_skill_detail(name):
-    """Get all variants of a skill by name."""
+    skill_md_lines is computed server-side, so the SKILL.md text itself is only
+    fetched when `full` is set. Not cached: --detail is how authors confirm a
+    publish landed, so it must reflect the registry as of now.
+    """
+    select = "name,variant,description_short,author,installs,forks,tags,requires_env,requires_runtime,depends_on,skill_md_lines,audited_at,created_at,updated_at"
+    if full:
+        select += ",skill_md"
     params = {
-        "select": "name,variant,description,author,installs,forks,tags,requires_env,requires_runtime,depends_on,skill_md,audited_at,created_at,updated_at",
+        "select": select,
         "name": f"eq.{name}",
         "order": "installs.desc",
     }
-    query_string = "&".join(f"{k}={urllib.parse.quote(str(v))}" for k, v in params.items())
+    query_string = urllib.parse.urlencode(params, safe=_QS_SAFE, quote_via=urllib.parse.quote)
     return supabase_get(f"skills?{query_string}")
 
 
+# Row fields shown per variant by --detail, fetched in one C-level call
+_detail_fields = itemgetter(
+    "variant", "author", "description_short", "installs", "forks", "tags", "requires_env",
+    "requires_runtime", "depends_on", "skill_md_lines", "audited_at", "updated_at",
+)
+
+
 def main():
     args = parse_args()
 
     args.limit = min(args.limit, 100)
 
     if args.detail:
-        results = get_skill_detail(args.detail)
+        results = get_skill_detail(args.detail, args.full)
         if not results:
             print(json.dumps({"status": "not_found", "name": args.detail}))
             return
 
-        # Show variants with truncated skill_md
+        # Show variants (SKILL.md as a line count unless --full)
         output = {
             "name": args.detail,
             "variant_count": len(results),
             "variants": [],
         }
         for r in results:
+            (variant_name, author, description, installs, forks, tags, requires_env,
+             requires_runtime, depends_on, skill_md_lines, audited_at, updated_at) = _detail_fields(r)
             variant = {
-                "variant": r["variant"],
-                "author": r["author"],
-                "description": r["description"][:200],
-                "installs": r["installs"],
-                "forks": r["forks"],
-                "tags": r["tags"],
-                "requires_env": r["requires_env"],
-                "requires_runtime": r["requires_runtime"],
-                "depends_on": r["depends_on"],
-                "skill_md_lines": len(r.get("skill_md", "").splitlines()),
-                "audited": r.get("audited_at") is not None,
-                "updated_at": r["updated_at"],
+                "variant": variant_name,
+                "author": author,
+                "description": description,
+                "installs": installs,
+                "forks": forks,
+                "tags": tags,
+                "requires_env": requires_env,
+                "requires_runtime": requires_runtime,
+                "depends_on": depends_on,
+                "skill_md_lines": skill_md_lines,
+                "audited": audited_at is not None,
+                "updated_at": updated_at,
             }
+            if args.full:
+                variant["skill_md"] = r["skill_md"]
             output["variants"].append(variant)
 
-        print(json.dumps(output, indent=2, ensure_ascii=False))
+        print_json(output)
         return
 
     if not args.query and not args.list_all:
@@ -115,37 +183,38 @@ def main():
         sys.exit(1)
 
     audited_only = not args.include_unaudited
-    results = search_skills(args.query, args.tag, args.limit, args.offset, args.sort, audited_only)
+    results = search_skills(args.query, args.tag, args.limit, args.offset, args.sort, audited_only, args.cursor)
 
     if not results:
         print(json.dumps({"status": "no_results", "query": args.query or "*", "results": []}))
         return
 
-    # Group by name to show variant counts
-    by_name = {}
-    for r in results:
-        name = r["name"]
-        if name not in by_name:
-            by_name[name] = {
-                "name": name,
-                "description": r["description"][:150],
-                "top_variant": r["variant"],
-                "author": r["author"],
-                "installs": r["installs"],
-                "tags": r["tags"],
-                "audited": r.get("audited_at") is not None,
-                "variants": [],
-            }
-        by_name[name]["variants"].append(r["variant"])
+    output_results = [
+        {
+            "name": r["name"],
+            "description": r["description"][:150],
+            "top_variant": r["top_variant"],
+            "author": r["author"],
+            "installs": r["installs"],
+            "tags": r["tags"],
+            "audited": r["audited_at"] is not None,
+            "variants": r["variants"],
+        }
+        for r in results
+    ]
 
     output = {
         "query": args.query,
-        "total": len(by_name),
+        "total": len(output_results),
         "offset": args.offset,
+        # Inferred from a full page — requests never send Prefer: count=...,
+        # so PostgREST skips the extra COUNT(*) over the filter
         "has_more": len(results) == args.limit,
-        "results": list(by_name.values()),
+        "results": output_results,
     }
-    print(json.dumps(output, indent=2, ensure_ascii=False))
+    if output["has_more"]:
+        output["next_cursor"] = encode_cursor(results[-1], args.sort)
+    print_json(output)
 
 
 if __name__ == "__main__":
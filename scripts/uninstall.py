@@ -3,11 +3,14 @@
 
 import argparse
 import json
-import re
 import shutil
 import sys
 from pathlib import Path
 
+# Add scripts/ to path so lib/ is importable
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from lib import SLUG_RE, find_skills_dir, walk_files
+
 
 def parse_args():
     p = argparse.ArgumentParser(description="Uninstall a local skill")
@@ -17,21 +20,9 @@ def parse_args():
     return p.parse_args()
 
 
-def find_skills_dir(override=None):
-    if override:
-        return Path(override)
-    cwd = Path.cwd()
-    for d in [cwd, *cwd.parents]:
-        candidate = d / ".claude" / "skills"
-        if candidate.is_dir():
-            return candidate
-    print("ERROR: cannot find .claude/skills/ directory", file=sys.stderr)
-    sys.exit(1)
-
-
 def main():
     args = parse_args()
-    if not re.match(r'^[a-z0-9][a-z0-9\-]{0,62}$', args.name):
+    if not SLUG_RE.match(args.name):
         print(f"ERROR: invalid skill name: {args.name}", file=sys.stderr)
         sys.exit(1)
     skills_dir = find_skills_dir(args.skills_dir)
@@ -41,11 +32,9 @@ def main():
         print(f"ERROR: skill not found: {skill_dir}", file=sys.stderr)
         sys.exit(1)
 
-    # Collect files for preview
-    files = sorted(str(f.relative_to(skill_dir)) for f in skill_dir.rglob("*") if f.is_file())
-
     if not args.yes:
-        # Preview mode
+        # Preview mode — the only path that needs the file list
+        files = sorted(rel for rel, _ in walk_files(skill_dir))
         output = {
             "action": "preview",
             "skill": args.name,
@@ -63,7 +52,7 @@ def main():
         "status": "ok",
         "skill": args.name,
         "deleted_from": str(skill_dir),
-        "file_count": len(files),
+        "file_count": None,  # not enumerated on --yes; rmtree walks the tree once
     }
     print(json.dumps(output, ensure_ascii=False))
     print("HINT: check if any env vars in .env are no longer needed", file=sys.stderr)
@@ -41,6 +41,66 @@ alter table skills add column if not exists fts tsvector
   ) stored;
 create index if not exists skills_fts_idx on skills using gin(fts);
 
+-- SKILL.md line count (same as Python's len(skill_md.splitlines()) for \n
+-- line endings), so search.py --detail doesn't have to download skill_md
+alter table skills add column if not exists skill_md_lines int
+  generated always as (
+    length(skill_md) - length(replace(skill_md, E'\n', ''))
+    + case when skill_md <> '' and right(skill_md, 1) <> E'\n' then 1 else 0 end
+  ) stored;
+
+-- First 200 chars of description — all search.py ever displays
+alter table skills add column if not exists description_short text
+  generated always as (left(description, 200)) stored;
+
+-- Search results grouped server-side: one row per name with the top matching
+-- variant and every matching variant name. The top variant follows p_sort:
+-- the most recently updated one for 'updated', otherwise the most installed,
+-- so sorting the result on that row's updated_at/installs orders skills the
+-- same way as sorting their variants. description is description_short.
+-- Filters are parameters, not PostgREST filters on the result, so a name is
+-- found when any of its variants matches — not only its top variant.
+-- search.py calls it with GET /rpc/skills_top_variant and adds
+-- order/limit/cursor filters.
+create or replace function skills_top_variant(
+  p_fts text default null,
+  p_tag text default null,
+  p_audited_only boolean default true,
+  p_sort text default 'installs'
+)
+returns table (
+  name text,
+  top_variant text,
+  description text,
+  author text,
+  installs int,
+  forks int,
+  tags text[],
+  audited_at timestamptz,
+  created_at timestamptz,
+  updated_at timestamptz,
+  variant_count int,
+  variants text[]
+)
+language sql stable as $$
+  select distinct on (s.name)
+    s.name, s.variant, s.description_short, s.author, s.installs, s.forks, s.tags,
+    s.audited_at, s.created_at, s.updated_at,
+    (count(*) over w)::int,
+    array_agg(s.variant) over w
+  from skills s
+  where (not p_audited_only or s.audited_at is not null)
+    and (p_fts is null or s.fts @@ to_tsquery(p_fts))
+    and (p_tag is null or s.tags @> array[p_tag])
+  window w as (partition by s.name
+               order by case when p_sort = 'updated' then s.updated_at end desc nulls last,
+                        s.installs desc, s.variant
+               rows between unbounded preceding and unbounded following)
+  order by s.name,
+           case when p_sort = 'updated' then s.updated_at end desc nulls last,
+           s.installs desc, s.variant;
+$$;
+
 -- Publisher identity table (API key ↔ author binding)
 create table if not exists publishers (
   api_key uuid primary key default gen_random_uuid(),
@@ -235,6 +295,10 @@ $$;
 -- RPC function: publish or update a skill (security definer — anon key can call)
 -- All validation happens server-side so users never need the service_role key.
 -- p_api_key authenticates the publisher — must match the registered author.
+-- p_fork_on_conflict: if name+variant belongs to another author, publish as
+-- variant = p_author (parent_id = original) instead of failing.
+-- Drop the pre-fork signature so PostgREST doesn't see two overloads.
+drop function if exists publish_skill(text, text, text, text, uuid, text[], text, jsonb, text[], text[], text[], text[], uuid);
 create or replace function publish_skill(
   p_name text,
   p_variant text,
@@ -248,7 +312,8 @@ create or replace function publish_skill(
   p_requires_tools text[] default '{}',
   p_requires_runtime text[] default '{}',
   p_depends_on text[] default '{}',
-  p_parent_id uuid default null
+  p_parent_id uuid default null,
+  p_fork_on_conflict boolean default false
 )
 returns jsonb
 language plpgsql security definer as $$
@@ -256,6 +321,9 @@ declare
   v_id uuid;
   v_existing record;
   v_action text;
+  v_variant text := p_variant;
+  v_parent_id uuid := p_parent_id;
+  v_forked boolean := false;
   v_file_tree_size int;
   v_registered_author text;
 begin
@@ -293,12 +361,25 @@ begin
 
   -- Check if this name+variant already exists
   select id, author into v_existing
-    from skills where name = p_name and variant = p_variant;
+    from skills where name = p_name and variant = v_variant;
+
+  -- Fork: another author owns this variant — publish under the author's name
+  if v_existing.id is not null and v_existing.author <> p_author and p_fork_on_conflict then
+    v_parent_id := v_existing.id;
+    v_variant := p_author;
+    v_forked := true;
+    if v_variant !~ '^[a-z0-9][a-z0-9\-]{0,62}$' then
+      raise exception 'cannot fork as variant "%" — author name is not a valid variant', v_variant;
+    end if;
+    perform increment_forks(v_parent_id);
+    select id, author into v_existing
+      from skills where name = p_name and variant = v_variant;
+  end if;
 
   if v_existing.id is not null then
     -- Only the original author can update
     if v_existing.author <> p_author then
-      raise exception 'variant % already exists by another author', p_variant;
+      raise exception 'variant % already exists by another author', v_variant;
     end if;
     update skills set
       description = p_description,
@@ -320,14 +401,15 @@ begin
       skill_md, file_tree, requires_env, requires_tools,
       requires_runtime, depends_on, parent_id
     ) values (
-      p_name, p_variant, p_description, p_author, p_tags,
+      p_name, v_variant, p_description, p_author, p_tags,
       p_skill_md, p_file_tree, p_requires_env, p_requires_tools,
-      p_requires_runtime, p_depends_on, p_parent_id
+      p_requires_runtime, p_depends_on, v_parent_id
     ) returning id into v_id;
-    v_action := 'published';
+    v_action := case when v_forked then 'forked' else 'published' end;
   end if;
 
-  return jsonb_build_object('id', v_id, 'action', v_action);
+  return jsonb_build_object('id', v_id, 'action', v_action,
+                            'variant', v_variant, 'parent_id', v_parent_id);
 end;
 $$;
 
@@ -355,3 +437,28 @@ begin
 end;
 $$;
 
+
+-- RPC function: record many audit results in one call (admin-only — audit.py sends
+-- one request per run instead of one per skill)
+-- p_rows: [{"p_skill_id": uuid, "p_passed": boolean}, ...]
+create or replace function audit_skills_bulk(p_rows jsonb)
+returns void
+language plpgsql security definer as $$
+declare
+  v_role text;
+begin
+  -- Enforce service_role — anon callers cannot mark skills as audited
+  v_role := coalesce(
+    current_setting('request.jwt.claims', true)::jsonb ->> 'role',
+    current_setting('role', true)
+  );
+  if v_role is distinct from 'service_role' then
+    raise exception 'admin-only: requires service_role key';
+  end if;
+
+  update skills s set
+    audited_at = case when (r ->> 'p_passed')::boolean then now() else null end
+  from jsonb_array_elements(p_rows) r
+  where s.id = (r ->> 'p_skill_id')::uuid;
+end;
+$$;